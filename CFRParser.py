@@ -1,15 +1,94 @@
+import asyncio
+import collections
+import contextlib
+import functools
 import json
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
 import requests as requests
 from enum import Enum
-from typing import Union
+from typing import Iterator, Tuple, Union
 from urllib.parse import quote
 
-from bs4 import BeautifulSoup
+import aiofiles
+import aiohttp
+import orjson
+from lxml import etree
+from requests.adapters import HTTPAdapter
+from tqdm import tqdm
 
 from CFRToMd import process_cfr_xml_element
 
+logger = logging.getLogger(__name__)
+
+TITLES_URL = "https://www.ecfr.gov/api/versioner/v1/titles"
+CACHE_DIR = Path("./cache")
+TITLES_CACHE_FILE = CACHE_DIR / "titles.json"
+# Seconds a persisted titles index is trusted before it is fetched again.
+TITLES_CACHE_TTL = 24 * 60 * 60
+
+# Bytes copied per read when streaming a title download to the cache.
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+
+# Root of the per-section JSON output.
+DOCUMENTS_DIR = Path("./documents")
+
+# Sections handed to a worker process at a time, and how many such batches may be queued at once.
+WRITE_BATCH_SIZE = 64
+MAX_IN_FLIGHT_BATCHES = 4 * (os.cpu_count() or 1)
+# Write buffer for the single-file JSON Lines output.
+ARCHIVE_BUFFER_SIZE = 8 * 1024 * 1024
+
+# Simultaneous connections used by fetch_titles_async.
+MAX_CONCURRENT_DOWNLOADS = 8
+# Seconds every eCFR request waits to connect and for each read, so a stalled server fails instead of hanging.
+DOWNLOAD_CONNECT_TIMEOUT = 30
+DOWNLOAD_READ_TIMEOUT = 120
+
+# One keep-alive session for every eCFR request so the TLS handshake is paid once per host, not per call.
+_SESSION = requests.Session()
+_SESSION.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=8))
+_SESSION.headers.update({"Accept-Encoding": "gzip"})
+
+# Structural DIVs that can enclose a section, outermost first.
+CONTAINER_TAGS = ("DIV1", "DIV2", "DIV3", "DIV4", "DIV5", "DIV6")
+CONTAINER_LABELS = {
+    "DIV1": "Title",
+    "DIV2": "Subtitle",
+    "DIV3": "Chapter",
+    "DIV4": "Subchapter",
+    "DIV5": "Part",
+    "DIV6": "Sub part",
+}
+# DIV8 is a section and DIV9 an appendix.
+SECTION_TAGS = ("DIV8", "DIV9")
+
+
+@functools.lru_cache(maxsize=8192)
+def _q(s: str) -> str:
+    """
+    URL-quotes a section or appendix number, memoized as the same numbers are quoted for both links and file names.
+    """
+    # Most section numbers (e.g. "1.25", "2-3") contain nothing quote() would change.
+    if s.isascii() and s.replace("-", "").replace(".", "").isalnum():
+        return s
+    return quote(s)
+
+
+def _ecfr_hierarchy(title_num, subtitle_num, chapter_num, part_num, subpart_num) -> str:
+    """
+    Returns the eCFR viewer URL of a title down to the given subpart. Levels that are None (e.g. a part without
+    subparts) are left out, as eCFR does not expect them in the path.
+    """
+    levels = (("subtitle", subtitle_num), ("chapter", chapter_num), ("part", part_num), ("subpart", subpart_num))
+    return f"https://www.ecfr.gov/current/title-{title_num}" + "".join(
+        f"/{level}-{number}" for level, number in levels if number is not None
+    )
+
 
 class DateChoice(Enum):
     LATEST_ISSUE_DATE = "latest_issue_date"
@@ -33,10 +112,10 @@ def get_ecfr_link_to_appendix(
     :param part_num: The part number of the CFR.
     :param subpart_num: The subpart number of the CFR containing the appendix.
     :param appendix_num: The number of the appendix.
-    :return: A link to the eCFR viewer for the specified appendix.
+    :return: A link to the eCFR viewer for the specified appendix. Levels passed as None are omitted.
     """
-    return f"https://www.ecfr.gov/current/title-{title_num}/subtitle-" \
-           f"{subtitle_num}/chapter-{chapter_num}/part-{part_num}/subpart-{subpart_num}/appendix-{quote(appendix_num)}"
+    return _ecfr_hierarchy(title_num, subtitle_num, chapter_num, part_num, subpart_num) + \
+        f"/appendix-{_q(appendix_num)}"
 
 def get_ecfr_link_to_section(
         title_num,
@@ -55,10 +134,40 @@ def get_ecfr_link_to_section(
     :param part_num: The part number of the CFR.
     :param subpart_num: The subpart number of the CFR containing the section.
     :param section_num: The number of the section.
-    :return: A link to the eCFR viewer for the specified section.
+    :return: A link to the eCFR viewer for the specified section. Levels passed as None are omitted.
     """
-    return f"https://www.ecfr.gov/current/title-{title_num}/subtitle-" \
-           f"{subtitle_num}/chapter-{chapter_num}/part-{part_num}/subpart-{subpart_num}/section-{quote(section_num)}"
+    return _ecfr_hierarchy(title_num, subtitle_num, chapter_num, part_num, subpart_num) + \
+        f"/section-{_q(section_num)}"
+
+
+@functools.lru_cache(maxsize=None)
+def _fetch_titles() -> dict:
+    """
+    Returns the eCFR titles index keyed by title number, fetched at most once per process.
+
+    The index is also persisted to TITLES_CACHE_FILE and reused from there while it is younger than
+    TITLES_CACHE_TTL seconds, so batch runs over many titles do not refetch it either. A cache file that
+    cannot be decoded is treated as expired.
+    """
+    titles = None
+    if TITLES_CACHE_FILE.is_file() and time.time() - TITLES_CACHE_FILE.stat().st_mtime < TITLES_CACHE_TTL:
+        try:
+            titles = json.loads(TITLES_CACHE_FILE.read_text())
+        except ValueError:
+            logger.warning("Ignoring unreadable titles cache %s", TITLES_CACHE_FILE)
+
+    if titles is None:
+        response = _SESSION.get(TITLES_URL, timeout=(DOWNLOAD_CONNECT_TIMEOUT, DOWNLOAD_READ_TIMEOUT))
+        response.raise_for_status()
+        titles = response.json()["titles"]
+
+        # Written beside the cache and moved into place, so concurrent or interrupted runs never see half a file.
+        TITLES_CACHE_FILE.parent.mkdir(parents=True, exist_ok=True)
+        partial_path = TITLES_CACHE_FILE.with_name(f"{TITLES_CACHE_FILE.name}.{os.getpid()}.part")
+        partial_path.write_text(json.dumps(titles))
+        partial_path.replace(TITLES_CACHE_FILE)
+
+    return {title["number"]: title for title in titles}
 
 
 def get_title_date(title_number: int, date_choice: DateChoice) -> Union[str, None]:
@@ -74,169 +183,445 @@ def get_title_date(title_number: int, date_choice: DateChoice) -> Union[str, Non
         str: The date in the format "YYYY-MM-DD" if the title number is found,
              otherwise returns None.
     """
-    response = requests.get("https://www.ecfr.gov/api/versioner/v1/titles")
-    response.raise_for_status()
-    titles = response.json()["titles"]
+    return _fetch_titles().get(title_number, {}).get(date_choice.value)
 
-    for title in titles:
-        if title["number"] == title_number:
-            return title[date_choice.value]
 
-    return None
+def _title_cache_path(title) -> Path:
+    """
+    Returns where the XML of a CFR title is cached.
+    """
+    return CACHE_DIR / f"title{title}.xml"
 
 
-def get_cfr_title_xml(title):
+def _title_xml_url(title) -> str:
+    """
+    Returns the eCFR URL of the latest issue of a CFR title's XML.
+    """
     base_url = "https://www.ecfr.gov/api/versioner/v1/full/"
     endpoint = f"{get_title_date(title, DateChoice.LATEST_ISSUE_DATE)}/title-{title}.xml"
-    url = base_url + endpoint
-    print(f"Request file from {url}")
+    return base_url + endpoint
+
+
+def _title_xml_headers(file_path: Path) -> dict:
+    """
+    Returns the request headers for downloading a title's XML to file_path, conditional on the ETag stored
+    beside it when a cached copy exists.
+    """
     headers = {"accept": "application/xml"}
 
-    response = requests.get(url, headers=headers)
+    etag_path = file_path.with_suffix(".etag")
+    if file_path.is_file() and etag_path.is_file():
+        headers["If-None-Match"] = etag_path.read_text()
+
+    return headers
 
-    if response.status_code == 200:
-        return response.text
+
+def _store_etag(file_path: Path, etag: Union[str, None]) -> None:
+    """
+    Records the ETag of the XML just downloaded to file_path, for the next conditional request.
+    """
+    etag_path = file_path.with_suffix(".etag")
+    if etag:
+        etag_path.write_text(etag)
     else:
-        print(f"Request failed with status code: {response.status_code}")
+        # A stale ETag would make the next request revalidate against another version of the file.
+        etag_path.unlink(missing_ok=True)
+
+
+def get_cfr_title_xml(title, file_path: Path) -> Union[Path, None]:
+    """
+    Downloads the latest issue of a CFR title's XML and streams it, as raw bytes, to file_path.
+
+    The body is written to a temporary file next to file_path and only moved into place once complete,
+    so an interrupted download never leaves a truncated file in the cache. The response's ETag is kept
+    beside it, and when file_path already exists the request is made conditional on that ETag, so an
+    unchanged title costs a single 304 round trip instead of a full download.
+
+    :param title: The title number of the CFR (e.g. 29 for Labor).
+    :param file_path: Where to store the XML.
+    :return: file_path if it now holds the current XML (downloaded or revalidated), otherwise None.
+    """
+    url = _title_xml_url(title)
+    logger.info("Request file from %s", url)
+
+    with _SESSION.get(url, headers=_title_xml_headers(file_path), stream=True,
+                      timeout=(DOWNLOAD_CONNECT_TIMEOUT, DOWNLOAD_READ_TIMEOUT)) as response:
+        if response.status_code == 304:
+            logger.info("Cached file for title %s is up to date", title)
+            return file_path
+
+        if response.status_code != 200:
+            logger.error("Request for title %s failed with status code: %s", title, response.status_code)
+            return None
+
+        # iter_content undoes the gzip transfer encoding and, unlike reading response.raw, raises a dropped
+        # connection or a corrupt body as a requests exception the caller can fall back from.
+        partial_path = file_path.with_name(file_path.name + ".part")
+        try:
+            with partial_path.open("wb") as f:
+                for chunk in response.iter_content(DOWNLOAD_CHUNK_SIZE):
+                    f.write(chunk)
+        except BaseException:
+            partial_path.unlink(missing_ok=True)
+            raise
+
+    partial_path.replace(file_path)
+    _store_etag(file_path, response.headers.get("ETag"))
+
+    return file_path
+
+
+async def _get_cfr_title_xml_async(session: aiohttp.ClientSession, title, url: str) -> Union[Path, None]:
+    """
+    The asyncio counterpart of get_cfr_title_xml, writing to the title's cache file as chunks arrive.
+    """
+    file_path = _title_cache_path(title)
+    partial_path = file_path.with_name(file_path.name + ".part")
+    logger.info("Request file from %s", url)
+
+    try:
+        async with session.get(url, headers=_title_xml_headers(file_path)) as response:
+            if response.status == 304:
+                logger.info("Cached file for title %s is up to date", title)
+                return file_path
+
+            if response.status != 200:
+                logger.error("Request for title %s failed with status code: %s", title, response.status)
+                return None
+
+            async with aiofiles.open(partial_path, "wb") as f:
+                async for chunk in response.content.iter_chunked(DOWNLOAD_CHUNK_SIZE):
+                    await f.write(chunk)
+    except (aiohttp.ClientError, asyncio.TimeoutError, OSError) as e:
+        # Failures are reported per title rather than raised, so one stalled or broken download does not make
+        # asyncio.gather abandon the others still in flight.
+        logger.error("Request for title %s failed: %s", title, e)
+        partial_path.unlink(missing_ok=True)
         return None
 
+    partial_path.replace(file_path)
+    _store_etag(file_path, response.headers.get("ETag"))
 
-def fetch_and_parse_cfr_xml(title_num):
-    # create a Path object for the file you want to check
-    file_path = Path(f'./cache/title{title_num}.xml')
+    return file_path
 
-    # check if the file exists
-    if file_path.is_file():
-        print("File in cache")
-        xml_data = file_path.open().read().encode("utf-8")
-    else:
-        print("File not in cache. Retrieve.")
-        # Make sure the director exists
-        if not file_path.parent.exists():
-            file_path.parent.mkdir(parents=True)
 
-        xml_data = get_cfr_title_xml(title_num)
-        file_path.write_text(xml_data)
+async def fetch_titles_async(title_nums) -> list:
+    """
+    Downloads (or revalidates) the XML of several CFR titles concurrently into the cache, so a multi-title run
+    waits for the slowest download rather than the sum of them. Parse them afterwards with
+    fetch_and_parse_cfr_xml(..., download=False). The titles index needed to build the download URLs is
+    fetched synchronously in a worker thread, so the coroutine never blocks the running event loop.
 
-    print(f"XML loaded for title {title_num}")
+    :param title_nums: The title numbers of the CFR to download.
+    :return: For each title, in order, its cache file, or None if the download failed.
+    """
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    # Resolve every URL up front. The titles index behind them is fetched with a blocking, timeout-bounded
+    # request at most once per process, so it runs in a worker thread rather than stalling the event loop;
+    # the titles are resolved one at a time so that fetch is not raced. If the index cannot be fetched, the
+    # title is reported as not downloaded and its cached copy, if any, is parsed as is.
+    urls = []
+    for title in title_nums:
+        try:
+            urls.append(await asyncio.to_thread(_title_xml_url, title))
+        except requests.RequestException as e:
+            logger.error("Request for title %s failed: %s", title, e)
+            urls.append(None)
+
+    async def download(session, title, url):
+        if url is None:
+            return None
+        return await _get_cfr_title_xml_async(session, title, url)
+
+    connector = aiohttp.TCPConnector(limit=MAX_CONCURRENT_DOWNLOADS)
+    # A full title can take well over aiohttp's default 5 minute total, so only bound connecting and each read.
+    timeout = aiohttp.ClientTimeout(total=None, sock_connect=DOWNLOAD_CONNECT_TIMEOUT, sock_read=DOWNLOAD_READ_TIMEOUT)
+    async with aiohttp.ClientSession(
+        connector=connector, timeout=timeout, headers={"Accept-Encoding": "gzip"}
+    ) as session:
+        return await asyncio.gather(*(download(session, title, url) for title, url in zip(title_nums, urls)))
+
+
+def _head_text(element) -> str:
+    """
+    Returns the text of an element's HEAD child, or an empty string if it has none.
+    """
+    head = element.find("HEAD")
+    return head.text if head is not None else ""
 
-    root = BeautifulSoup(xml_data, features="xml")
 
-    title = root.find("DIV1")
-    title_description = title.HEAD.string if title.HEAD else ""
-    print(f"Title description: {title_description}")
+def _free_processed(element) -> None:
+    """
+    Clears a fully handled element and drops its preceding siblings, keeping the partially built tree to O(depth).
+    """
+    element.clear(keep_tail=True)
+    while element.getprevious() is not None:
+        del element.getparent()[0]
+
+
+def _iter_section_fragments(title_num, file_path: Path) -> Iterator[Tuple[str, bytes, dict]]:
+    """
+    Streams a CFR title's XML and yields each section and appendix in it as a serialized XML fragment, in
+    document order. Fragments are plain bytes, so they are cheap to pickle over to worker processes.
+
+    :param title_num: The title number of the CFR (e.g. 29 for Labor).
+    :param file_path: The title's XML file.
+    :return: An iterator of (section_path, fragment, metadata) triples, where section_path is where the
+             section belongs relative to the output directory.
+    """
+    # (number, description) of each structural DIV currently open, keyed by its tag.
+    ancestor_meta = {}
+    ancestors_changed = True
+
+    # One linear pass. Opening and closing a structural DIV, or reading its HEAD, updates that tag's slot in
+    # ancestor_meta; a finished section (DIV8) or appendix (DIV9) is emitted with whatever the slots hold then.
+    events = etree.iterparse(
+        str(file_path), events=("start", "end"), tag=CONTAINER_TAGS + SECTION_TAGS + ("HEAD",)
+    )
+    for event, element in events:
+        tag = element.tag
+
+        if tag in CONTAINER_TAGS:
+            if event == "start":
+                ancestor_meta[tag] = (element.get("N"), "")
+            else:
+                del ancestor_meta[tag]
+                _free_processed(element)
+            ancestors_changed = True
+            continue
+
+        if event == "start":
+            continue
+
+        if tag == "HEAD":
+            parent_tag = element.getparent().tag
+            # Section HEADs are read when the section itself ends.
+            if parent_tag in ancestor_meta:
+                number, _ = ancestor_meta[parent_tag]
+                ancestor_meta[parent_tag] = (number, element.text)
+                ancestors_changed = True
+                logger.debug("%s %s - %s", CONTAINER_LABELS[parent_tag], number, element.text)
+            continue
+
+        # Consecutive sections usually share a subpart, so only redo the per-container work when it changed.
+        if ancestors_changed:
+            ancestors_changed = False
+
+            _, title_description = ancestor_meta.get("DIV1", (None, ""))
+            subtitle_number, _ = ancestor_meta.get("DIV2", (None, ""))
+            chapt_number, chapt_description = ancestor_meta.get("DIV3", (None, ""))
+            subchapter_number, subchapter_description = ancestor_meta.get("DIV4", (None, ""))
+            part_number, part_description = ancestor_meta.get("DIV5", (None, ""))
+            sub_part_number, sub_part_description = ancestor_meta.get("DIV6", (None, ""))
+
+            # A plain string joined once per subpart; sections only append their file name to it. Levels the
+            # section is not nested in (e.g. no subpart) get no directory rather than a "_None" one.
+            levels = (
+                ("subtitle", subtitle_number),
+                ("chap", chapt_number),
+                ("subchapt", subchapter_number),
+                ("part", part_number),
+                ("subpart", sub_part_number),
+            )
+            subpart_dir = os.path.join(
+                f"title_{title_num}", *(f"{level}_{number}" for level, number in levels if number is not None)
+            )
+
+            base_meta = {
+                "title_number": title_num,
+                "title_description": title_description,
+                "chapter_number": chapt_number,
+                "chapter_description": chapt_description,
+                "subchapter_number": subchapter_number,
+                "subchapter_description": subchapter_description,
+                "part_number": part_number,
+                "part_description": part_description,
+                "sub_part_number": sub_part_number,
+                "sub_part_description": sub_part_description,
+            }
+
+        number = element.get("N")
+        description = _head_text(element)
+
+        if tag == "DIV8":
+            kind = "section"
+            ecfr_link = get_ecfr_link_to_section(
+                title_num,
+                subtitle_number,
+                chapt_number,
+                part_number,
+                sub_part_number,
+                number
+            )
+        else:
+            kind = "appendix"
+            ecfr_link = get_ecfr_link_to_appendix(
+                title_num,
+                subtitle_number,
+                chapt_number,
+                part_number,
+                sub_part_number,
+                number
+            )
+
+        metadata = {
+            **base_meta,
+            f"{kind}_number": number,
+            f"{kind}_description": description,
+            "url": ecfr_link
+        }
+
+        fragment = etree.tostring(element, encoding="utf-8", with_tail=False)
+        _free_processed(element)
+
+        yield subpart_dir + os.sep + _q(number) + ".json", fragment, metadata
+
+
+def _render_section(fragment: bytes, metadata: dict) -> dict:
+    """
+    Turns a section fragment and its metadata into the result written for it.
+    """
+    return {
+        "page_content": process_cfr_xml_element(fragment) + f"\n\n__{metadata['url']}__",
+        "metadata": metadata
+    }
+
+
+def iter_sections(title_num, file_path: Path) -> Iterator[Tuple[str, dict]]:
+    """
+    Streams a CFR title's XML and yields each section and appendix in it, in document order.
+
+    Nothing is written to disk, so the parse can be consumed directly or fed to any sink.
+
+    :param title_num: The title number of the CFR (e.g. 29 for Labor).
+    :param file_path: The title's XML file.
+    :return: An iterator of (section_path, result) pairs. result holds the section's page_content and metadata;
+             section_path is where it belongs relative to the output directory.
+    """
+    for section_path, fragment, metadata in _iter_section_fragments(title_num, file_path):
+        yield section_path, _render_section(fragment, metadata)
+
+
+def write_section(result: dict, section_file: str, pretty: bool = False) -> None:
+    """
+    Writes one section or appendix produced by iter_sections to its JSON file.
+
+    :param result: The section's page_content and metadata.
+    :param section_file: The file to write. Its directory must already exist.
+    :param pretty: Indent the JSON for human reading.
+    """
+    with open(section_file, "wb") as f:
+        f.write(orjson.dumps(result, option=orjson.OPT_INDENT_2 if pretty else 0))
+
+
+def _write_sections(batch: list, pretty: bool = False) -> None:
+    """
+    Renders and writes a batch of (fragment, metadata, section_file) triples. Runs in a worker process.
+    """
+    for fragment, metadata, section_file in batch:
+        write_section(_render_section(fragment, metadata), section_file, pretty)
 
-    parsed_sections = []
 
-    # Chapter is Div3
-    # subchapter is Div4
-
-    for subtitle in root.find_all("DIV2"):
-        subtitle_number = subtitle['N']
-        subtitle_description = subtitle.HEAD.string if subtitle.HEAD else ""
-        print(f"Subtitle {subtitle_number} - {subtitle_description}")
-
-        for chapter in subtitle.find_all("DIV3"):
-            chapt_number = chapter["N"]
-            chapt_description = chapter.HEAD.string if chapter.HEAD else ""
-
-            print(f"Subchapter {chapt_number} - {chapt_description}")
-
-            for subchapter in chapter.find_all("DIV4"):
-                subchapter_number = subchapter['N']
-                subchapter_description = subchapter.HEAD.string if subchapter.HEAD else ""
-                print(f"Subchapter {subchapter_number} - {subchapter_description}")
-
-                for part in root.find_all("DIV5"):
-                    part_number = part["N"]
-                    part_description = part.HEAD.string if part.HEAD else ""
-                    print(f"Part {part_number} - {part_description}")
-
-                    for sub_part in root.find_all("DIV6"):
-                        sub_part_number = sub_part["N"]
-                        sub_part_description = sub_part.HEAD.string if sub_part.HEAD else ""
-                        print(f"Sub part {sub_part_number}: {sub_part_description}")
-
-                        for section in sub_part.find_all("DIV8"):
-                            section_number = section["N"]
-                            section_description = section.HEAD.string if section.HEAD else ""
-
-                            ecfr_link = get_ecfr_link_to_section(
-                                    title_num,
-                                    subtitle_number,
-                                    chapt_number,
-                                    part_number,
-                                    sub_part_number,
-                                    section_number
-                                )
-                            metadata = {
-                                "title_number": title_num,
-                                "title_description": title_description,
-                                "chapter_number": chapt_number,
-                                "chapter_description": chapt_description,
-                                "subchapter_number": subchapter_number,
-                                "subchapter_description": subchapter_description,
-                                "part_number": part_number,
-                                "part_description": part_description,
-                                "sub_part_number": sub_part_number,
-                                "sub_part_description": sub_part_description,
-                                "section_number": section_number,
-                                "section_description": section_description,
-                                "url": ecfr_link
-                            }
-
-                            result = {
-                                "page_content": process_cfr_xml_element(section) + f"\n\n__{ecfr_link}__",
-                                "metadata": metadata
-                            }
-
-                            section_file = Path(f"./documents/title_{title_num}/subtitle_{subtitle_number}/chap_"
-                                                f"{chapt_number}/subchapt_{subchapter_number}/part_{part_number}/"
-                                                f"subpart_{sub_part_number}/{quote(section_number)}.json")
-
-                            if not section_file.parent.exists():
-                                section_file.parent.mkdir(parents=True)
-
-                            section_file.write_text(json.dumps(result, indent=4))
-
-                        for appendix in sub_part.find_all("DIV9"):
-                            appendix_number = appendix['N']
-                            appendix_description = appendix.HEAD.string if appendix.HEAD else ""
-
-                            ecfr_link=get_ecfr_link_to_appendix(
-                                    title_num,
-                                    subtitle_number,
-                                    chapt_number,
-                                    part_number,
-                                    sub_part_number,
-                                appendix_number
-                                )
-                            metadata = {
-                                "title_number": title_num,
-                                "title_description": title_description,
-                                "chapter_number": chapt_number,
-                                "chapter_description": chapt_description,
-                                "subchapter_number": subchapter_number,
-                                "subchapter_description": subchapter_description,
-                                "part_number": part_number,
-                                "part_description": part_description,
-                                "sub_part_number": sub_part_number,
-                                "sub_part_description": sub_part_description,
-                                "appendix_number": appendix_number,
-                                "appendix_description": appendix_description,
-                                "url": ecfr_link
-                            }
-
-                            result = {
-                                "page_content": process_cfr_xml_element(appendix) + f"\n\n__{ecfr_link}__",
-                                "metadata": metadata
-                            }
-
-                            appendix_file = Path(f"./documents/title_{title_num}/subtitle_{subtitle_number}/chap_"
-                                                f"{chapt_number}/subchapt_{subchapter_number}/part_{part_number}/"
-                                                f"subpart_{sub_part_number}/{quote(appendix_number)}.json")
-
-                            if not appendix_file.parent.exists():
-                                appendix_file.parent.mkdir(parents=True)
-
-                            appendix_file.write_text(json.dumps(result, indent=4))
+def _encode_sections(batch: list) -> bytes:
+    """
+    Renders a batch of (fragment, metadata, section_file) triples into JSON Lines. Runs in a worker process.
+    """
+    return b"".join(
+        orjson.dumps(_render_section(fragment, metadata)) + b"\n" for fragment, metadata, _ in batch
+    )
+
+
+def fetch_and_parse_cfr_xml(title_num, archive: bool = False, pretty: bool = False, download: bool = True) -> list:
+    """
+    Downloads (or loads from cache) the XML for a CFR title and writes every section and appendix in it
+    to its own JSON file under ./documents.
+
+    :param title_num: The title number of the CFR (e.g. 29 for Labor).
+    :param archive: Instead of one file per section, append every section as a line of
+                    ./documents/title_{title_num}.jsonl. One sequential write stream is much faster than
+                    creating tens of thousands of small files.
+    :param pretty: Indent the per-section JSON files for human reading. Compact JSON is several times faster to
+                   encode and smaller on disk. Ignored in archive mode, where every record must fit on one line.
+    :param download: Download or revalidate the title's XML first. Pass False to parse the cached copy as is,
+                     e.g. after fetch_titles_async.
+    :return: The paths of the JSON files written, one per section or appendix in the source XML. In archive
+             mode these are the paths the sections would have had, in the order of the archive's lines.
+    """
+    file_path = _title_cache_path(title_num)
+    file_path.parent.mkdir(parents=True, exist_ok=True)
+
+    # Download the title, or revalidate the cached copy with a conditional GET. If eCFR cannot be reached,
+    # a cached copy is still better than nothing.
+    downloaded = None
+    if download:
+        try:
+            downloaded = get_cfr_title_xml(title_num, file_path)
+        except requests.RequestException as e:
+            logger.error("Request for title %s failed: %s", title_num, e)
+
+    if downloaded is None:
+        if not file_path.is_file():
+            logger.error("No XML available for title %s", title_num)
+            return []
+        logger.info("Using cached file for title %s", title_num)
+
+    logger.info("XML loaded for title %s", title_num)
+
+    parsed_sections = []
+    batch = []
+    in_flight = collections.deque()
+    worker = _encode_sections if archive else functools.partial(_write_sections, pretty=pretty)
+
+    with contextlib.ExitStack() as stack:
+        executor = stack.enter_context(ProcessPoolExecutor())
+        progress = stack.enter_context(tqdm(desc=f"Title {title_num}", unit=" sections"))
+
+        archive_file = None
+        if archive:
+            archive_path = DOCUMENTS_DIR / f"title_{title_num}.jsonl"
+            archive_path.parent.mkdir(parents=True, exist_ok=True)
+            archive_file = stack.enter_context(archive_path.open("wb", buffering=ARCHIVE_BUFFER_SIZE))
+
+        def drain(future):
+            # Batches are drained oldest first, so archive lines keep document order.
+            encoded = future.result()
+            if archive_file is not None:
+                archive_file.write(encoded)
+
+        # The parser runs here while the workers render, serialize and write earlier batches, so parsing
+        # overlaps with the Markdown conversion, encoding and disk flushes.
+        documents_prefix = str(DOCUMENTS_DIR) + os.sep
+        section_dir = None
+        for section_path, fragment, metadata in _iter_section_fragments(title_num, file_path):
+            section_file = documents_prefix + section_path
+            # Sections arrive grouped by subpart, so each directory only needs creating once.
+            if not archive and os.path.dirname(section_file) != section_dir:
+                section_dir = os.path.dirname(section_file)
+                os.makedirs(section_dir, exist_ok=True)
+
+            batch.append((fragment, metadata, section_file))
+            parsed_sections.append(section_file)
+            progress.update()
+
+            if len(batch) == WRITE_BATCH_SIZE:
+                in_flight.append(executor.submit(worker, batch))
+                batch = []
+                # Wait on the oldest batch once enough are queued, so a parser that outruns the
+                # workers does not end up buffering the whole title in memory.
+                if len(in_flight) > MAX_IN_FLIGHT_BATCHES:
+                    drain(in_flight.popleft())
+
+        if batch:
+            in_flight.append(executor.submit(worker, batch))
+        for future in in_flight:
+            drain(future)
+
+    # Every section is visited exactly once, so a repeated path means two sections overwrote each other.
+    duplicates = len(parsed_sections) - len(set(parsed_sections))
+    if duplicates:
+        logger.warning(
+            "%s of %s sections were written to an already used path", duplicates, len(parsed_sections)
+        )
+
+    logger.info("Wrote %s sections for title %s", len(parsed_sections), title_num)
+    return parsed_sections
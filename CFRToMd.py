@@ -1,26 +1,23 @@
-import xml.etree.ElementTree as ET
-from typing import Optional
+from lxml import etree
 
 
 def process_cfr_xml_element(element) -> str:
     """
     Process an XML element and return its corresponding Markdown representation.
 
-    :param element: An XML element from the CFR XML data
-    :type element: xml.etree.ElementTree.Element
+    :param element: An XML element from the CFR XML data, or such an element serialized to bytes
+    :type element: lxml.etree._Element or bytes
     :return: The Markdown representation of the input XML element
     :rtype: str
     """
+    if isinstance(element, bytes):
+        element = etree.fromstring(element)
 
-    title = element.HEAD.string if element.HEAD else "NO TITLE"
-    paragraphs = []
-    for p in element.find_all("P"):
-        if p.string:
-            paragraphs.append(p.string)
-        else:
-            paragraphs.append("\n")
-    text = "\n".join(paragraphs)
-    citation = element.CITA.string if element.CITA else "NO CITE"
+    title = element.findtext("HEAD", default="NO TITLE")
+    # Paragraphs can sit inside nested markup (e.g. extracts in appendices), so search the whole subtree.
+    # itertext() keeps text inside and after inline markup such as <I> or <E T="03">, which .text would cut off.
+    text = "\n".join(["".join(p.itertext()) or "\n" for p in element.iterfind(".//P")])
+    citation = element.findtext("CITA", default="NO CITE")
 
     return f"""
     # {title}
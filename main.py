@@ -1,7 +1,33 @@
+import argparse
+import asyncio
 import json
+import logging
+import sys
 
-from CFRParser import fetch_and_parse_cfr_xml
+from tqdm.contrib.logging import logging_redirect_tqdm
+
+from CFRParser import fetch_and_parse_cfr_xml, fetch_titles_async
 
 if __name__ == "__main__":
-    title = 7
-    fetch_and_parse_cfr_xml(title)
+    parser = argparse.ArgumentParser(description="Split CFR titles into one JSON document per section.")
+    parser.add_argument("titles", nargs="*", type=int, default=[7], help="CFR title numbers to ingest (default: 7)")
+    parser.add_argument("--pretty", action="store_true", help="indent the JSON output for human reading")
+    parser.add_argument(
+        "--archive",
+        action="store_true",
+        help="write each title to a single documents/title_N.jsonl instead of one file per section",
+    )
+    parser.add_argument("--verbose", action="store_true", help="log every subtitle, chapter, part and subpart parsed")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s", handlers=[logging.StreamHandler(sys.stdout)])
+    if args.verbose:
+        logging.getLogger("CFRParser").setLevel(logging.DEBUG)
+
+    # Download every title concurrently, then parse them one after another; each parse already
+    # spreads its work over all cores.
+    asyncio.run(fetch_titles_async(args.titles))
+    # Route log records through tqdm while parsing so they print above the progress bar instead of into it.
+    with logging_redirect_tqdm():
+        for title in args.titles:
+            fetch_and_parse_cfr_xml(title, archive=args.archive, pretty=args.pretty, download=False)
@@ -0,0 +1,120 @@
+import asyncio
+import http.server
+import json
+import os
+import threading
+
+import pytest
+
+import CFRParser
+
+TITLE_XML = (
+    b'<?xml version="1.0"?><ECFR><DIV1 N="9" TYPE="TITLE"><HEAD>Title 9</HEAD>'
+    b'<DIV3 N="I" TYPE="CHAPTER"><HEAD>Chapter I</HEAD><DIV5 N="1" TYPE="PART"><HEAD>Part 1</HEAD>'
+    b'<DIV8 N="1.3" TYPE="SECTION"><HEAD>Section 1.3</HEAD><P>x <I>it</I> tail</P></DIV8>'
+    b'<DIV6 N="A" TYPE="SUBPART"><HEAD>Subpart A</HEAD>'
+    b'<DIV8 N="1.4" TYPE="SECTION"><HEAD>Section 1.4</HEAD><P>y</P></DIV8></DIV6>'
+    b'<DIV9 N="Appendix A to Part 1" TYPE="APPENDIX"><HEAD>Appendix A</HEAD><P>z</P></DIV9>'
+    b'</DIV5></DIV3></DIV1></ECFR>'
+)
+
+
+class _TruncatingHandler(http.server.BaseHTTPRequestHandler):
+    """Promises a full title but drops the connection partway through the body."""
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(TITLE_XML) * 10))
+        self.end_headers()
+        self.wfile.write(TITLE_XML[:50])
+        self.wfile.flush()
+        self.close_connection = True
+
+    def log_message(self, *args):
+        pass
+
+
+class _FailingHandler(_TruncatingHandler):
+    """Answers every request with a server error."""
+
+    def do_GET(self):
+        self.send_error(503)
+
+
+@pytest.fixture
+def warm_cache(tmp_path, monkeypatch):
+    """Runs the test in an empty directory whose cache already holds title 9."""
+    monkeypatch.chdir(tmp_path)
+    file_path = CFRParser._title_cache_path(9)
+    file_path.parent.mkdir(parents=True)
+    file_path.write_bytes(TITLE_XML)
+    return file_path
+
+
+def _serve(handler, monkeypatch):
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setattr(CFRParser, "_title_xml_url", lambda title: f"http://127.0.0.1:{server.server_port}/")
+    return server
+
+
+@pytest.mark.parametrize("handler", [_TruncatingHandler, _FailingHandler])
+def test_failed_download_parses_cached_title(warm_cache, monkeypatch, handler):
+    server = _serve(handler, monkeypatch)
+    try:
+        paths = CFRParser.fetch_and_parse_cfr_xml(9)
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    assert warm_cache.read_bytes() == TITLE_XML
+    assert not warm_cache.with_name(warm_cache.name + ".part").exists()
+    assert len(paths) == 3
+    assert all(os.path.isfile(path) for path in paths)
+
+
+def test_unreachable_server_parses_cached_title(warm_cache, monkeypatch):
+    def refuse(*args, **kwargs):
+        raise CFRParser.requests.ConnectionError("connection refused")
+
+    monkeypatch.setattr(CFRParser, "_title_xml_url", lambda title: "http://127.0.0.1:9/")
+    monkeypatch.setattr(CFRParser._SESSION, "get", refuse)
+
+    paths = CFRParser.fetch_and_parse_cfr_xml(9)
+
+    assert len(paths) == 3
+    assert all(os.path.isfile(path) for path in paths)
+
+
+def test_unreadable_titles_cache_is_refetched(tmp_path, monkeypatch):
+    class Response:
+        def raise_for_status(self):
+            pass
+
+        def json(self):
+            return {"titles": [{"number": 9, "latest_issue_date": "2024-01-02"}]}
+
+    monkeypatch.chdir(tmp_path)
+    CFRParser.TITLES_CACHE_FILE.parent.mkdir(parents=True)
+    CFRParser.TITLES_CACHE_FILE.write_text('[{"number": 9, "latest_')
+    monkeypatch.setattr(CFRParser._SESSION, "get", lambda *args, **kwargs: Response())
+    CFRParser._fetch_titles.cache_clear()
+    try:
+        titles = CFRParser._fetch_titles()
+    finally:
+        CFRParser._fetch_titles.cache_clear()
+
+    assert titles[9]["latest_issue_date"] == "2024-01-02"
+    assert json.loads(CFRParser.TITLES_CACHE_FILE.read_text()) == [titles[9]]
+    assert list(CFRParser.CACHE_DIR.iterdir()) == [CFRParser.TITLES_CACHE_FILE]
+
+
+def test_fetch_titles_async_without_titles_index(tmp_path, monkeypatch):
+    def refuse(*args, **kwargs):
+        raise CFRParser.requests.ConnectionError("connection refused")
+
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(CFRParser._SESSION, "get", refuse)
+    CFRParser._fetch_titles.cache_clear()
+
+    assert asyncio.run(CFRParser.fetch_titles_async([9, 29])) == [None, None]